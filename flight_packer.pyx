@@ -0,0 +1,28 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Cython build of the flight packer in traveling_zipline_project.py, for runs
+that should not pay Numba's import and JIT cost. Build it in place with:
+
+> cythonize -i flight_packer.pyx
+"""
+
+
+def pick_orders(const Py_ssize_t[::1] hids, const double[:, ::1] dist, const double[:, ::1] leg_with_return,
+                int capacity, double max_range) -> int:
+    """
+    Greedily pack candidate orders, given by hospital id in priority order, into one flight.
+    Returns how many leading candidates fit within the Zip's capacity and range.
+    """
+    cdef double total_distance = 0.0
+    cdef Py_ssize_t last_location = 0  # start at Nest
+    cdef Py_ssize_t i, hid
+    cdef Py_ssize_t n = min(capacity, hids.shape[0])
+    cdef int fits = 1  # stays 1 while every candidate so far is within range
+    cdef int count = 0
+    for i in range(n):
+        hid = hids[i]
+        fits &= total_distance + leg_with_return[last_location, hid] <= max_range
+        count += fits
+        total_distance += dist[last_location, hid]
+        last_location = hid
+    return count
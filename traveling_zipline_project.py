@@ -5,9 +5,26 @@ Zipline Project
 
 # import package
 import os
-import math
+import csv
+import heapq
+from collections import deque
+from itertools import repeat
+import numpy as np
 import pandas as pd
-from typing import Dict, List, TextIO, Tuple
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    # ahead-of-time compiled packer, built with `cythonize -i flight_packer.pyx`
+    from flight_packer import pick_orders as compiled_pick_orders
+except ImportError:
+    compiled_pick_orders = None
+
+njit = None
+if compiled_pick_orders is None:  # only pay for importing Numba when it is used
+    try:
+        from numba import njit, prange
+    except ImportError:  # Numba is optional: fall back to the NumPy packer
+        pass
 
 # Each Nest has this many Zips
 NUM_ZIPS = 10
@@ -26,7 +43,64 @@ ZIP_MAX_CUMULATIVE_RANGE_M = 160 * 1000  # 160 km -> meters
 EMERGENCY = "Emergency"
 RESUPPLY = "Resupply"
 
+# Columns of the flight schedule, one row per route segment
+FLIGHT_SCHEDULE_COLUMNS = ["Flight ID", "Zip ID", "From", "To", "Launch Time"]
+
+# Candidate windows at least this long are packed in parallel (Numba only)
+PARALLEL_PACKING_MIN_CANDIDATES = 1024
+
+def pick_orders_numpy(hids: np.ndarray, dist: np.ndarray, leg_with_return: np.ndarray, capacity: int, max_range: int) -> int:
+    """
+    Vectorized pick_orders: checks the range of every candidate in one pass.
+    """
+    hids = hids[:capacity]
+    previous = np.concatenate(([0], hids[:-1]))  # start at Nest
+    legs = dist[previous, hids]
+    total_distance = np.concatenate(([0.0], np.cumsum(legs)[:-1]))  # flown before each stop
+    fits = total_distance + leg_with_return[previous, hids] <= max_range
+    # the Zip stops at the first candidate that does not fit
+    return len(fits) if fits.all() else int(fits.argmin())
+
+
+pick_orders_from_every_start = None  # only available with Numba
+if compiled_pick_orders is not None:
+    pick_orders = compiled_pick_orders
+elif njit is not None:
+    @njit(cache=True)
+    def pick_orders(hids: np.ndarray, dist: np.ndarray, leg_with_return: np.ndarray, capacity: int, max_range: int) -> int:
+        """
+        Greedily pack candidate orders, given by hospital id in priority order, into one flight.
+        Returns how many leading candidates fit within the Zip's capacity and range.
+        """
+        total_distance = 0.0
+        last_location = 0  # start at Nest
+        fits = 1  # stays 1 while every candidate so far is within range
+        count = 0
+        # no early exit: a candidate past the first misfit no longer counts, which keeps the loop branch free
+        for i in range(min(capacity, hids.shape[0])):
+            hid = hids[i]
+            fits &= int(total_distance + leg_with_return[last_location, hid] <= max_range)
+            count += fits
+            total_distance += dist[last_location, hid]
+            last_location = hid
+        return count
+
+    @njit(parallel=True, cache=True)
+    def pick_orders_from_every_start(hids: np.ndarray, dist: np.ndarray, leg_with_return: np.ndarray, capacity: int, max_range: int) -> np.ndarray:
+        """
+        Run pick_orders on the candidates from every start position at once.
+        Returns the packed count for each start, so Zips can then be assigned by chaining counts.
+        """
+        counts = np.zeros(hids.shape[0], dtype=np.int64)
+        for start in prange(hids.shape[0]):
+            counts[start] = pick_orders(hids[start:], dist, leg_with_return, capacity, max_range)
+        return counts
+else:
+    pick_orders = pick_orders_numpy
+
 class Hospital:
+    __slots__ = ("name", "north_m", "east_m")
+
     def __init__(self, name: str, north_m: int, east_m: int):
         self.name = name
         self.north_m = north_m
@@ -34,27 +108,39 @@ class Hospital:
 
     @staticmethod
     def load_from_csv(f: TextIO) -> Dict[str, "Hospital"]:
+        # names stay verbatim strings, even when numeric or spelled like a missing value ("NA")
+        data = pd.read_csv(f, header=None, names=["name", "north_m", "east_m"], dtype={"name": str},
+                           keep_default_na=False, skipinitialspace=True)
+        names = data["name"].str.strip().tolist()
         hospitals = {}
-        for line in f.readlines():
-            fields = [values.strip() for values in line.split(",")]
-            name = fields[0]
-            hospitals[name] = Hospital(name=name, north_m=int(fields[1]), east_m=int(fields[2]))
+        for name, north_m, east_m in zip(names, data["north_m"].tolist(), data["east_m"].tolist()):
+            hospitals[name] = Hospital(name=name, north_m=north_m, east_m=east_m)
         return hospitals
 
+# Every flight starts and ends at the Nest
+NEST = Hospital("Nest", 0, 0)
+
 class Order:
+    __slots__ = ("order_id", "time", "hospital", "priority", "priority_rank")
+
     def __init__(self, order_id: int, time: int, hospital: Hospital, priority: str):
         self.order_id = order_id
         self.time = time
         self.hospital = hospital
         self.priority = priority
+        self.priority_rank = 0 if priority == EMERGENCY else 1  # Emergency orders go first
 
     @staticmethod
     def load_from_csv(f: TextIO, hospitals: Dict[str, Hospital]) -> List["Order"]:
-        orders = []
-        for i, line in enumerate(f.readlines()):
-            fields = [values.strip() for values in line.split(",")]
-            orders.append(Order(order_id=i+1, time=int(fields[0]), hospital=hospitals[fields[1]], priority=fields[2]))
-        return orders
+        data = pd.read_csv(f, header=None, names=["time", "hospital", "priority"], dtype={"hospital": str, "priority": str},
+                           keep_default_na=False, skipinitialspace=True)
+        times = data["time"].tolist()
+        hospital_names = data["hospital"].str.strip().tolist()
+        priorities = data["priority"].str.strip().tolist()
+        return [
+            Order(order_id=i+1, time=time, hospital=hospitals[name], priority=priority)
+            for i, (time, name, priority) in enumerate(zip(times, hospital_names, priorities))
+        ]
 
 class Flight:
     def __init__(self, flight_id: int, zip_id: int, launch_time: int, orders: List[Order], route: List[str], completion_time: int, route_times: List[int]):
@@ -84,40 +170,82 @@ class Flight:
 class ZipScheduler:
     def __init__(self, hospitals: Dict[str, Hospital]):
         self.hospitals = hospitals
-        self._unfulfilled_orders: List[Order] = []
-        self.zip_availability = {i: 0 for i in range(1, NUM_ZIPS + 1)}  # each Zip is available
+        # heap of (priority rank, time, order id, order): Emergency orders first, then by earliest time
+        self._unfulfilled_orders: List[Tuple[int, int, int, Order]] = []
+        # heap of (available time, zip id); each Zip is available
+        self._zip_heap: List[Tuple[int, int]] = [(0, i) for i in range(1, NUM_ZIPS + 1)]
+        heapq.heapify(self._zip_heap)
+
+        # index every location once: the Nest is row 0, hospitals follow
+        if NEST.name in hospitals:
+            raise ValueError(f"hospital name {NEST.name!r} is reserved for the Nest")
+        self._location_ids: Dict[str, int] = {NEST.name: 0}
+        for i, name in enumerate(hospitals, start=1):
+            self._location_ids[name] = i
+        self._north = np.array([NEST.north_m] + [h.north_m for h in hospitals.values()], dtype=np.int32)
+        self._east = np.array([NEST.east_m] + [h.east_m for h in hospitals.values()], dtype=np.int32)
+
+        # pairwise distances (m) and segment times (s) between all locations
+        self._dist = np.hypot(self._north[:, None] - self._north[None, :], self._east[:, None] - self._east[None, :])
+        # distance of each leg plus the flight back to the Nest, for the range check
+        self._leg_with_return = self._dist + self._dist[:, 0]
+        self._seg_time = (self._dist / ZIP_SPEED_MPS).astype(np.int32)
+
+        # segment times of routes already flown, keyed by the route's location ids
+        self._route_times_cache: Dict[Tuple[int, ...], Tuple[int, ...]] = {}
 
 
     def calculate_segment_time(self, start_location: str, end_location: str) -> int:
         """
         Calculate the time for a Zip to travel between two locations.
         """
-        start = Hospital("Nest", 0, 0) if start_location == "Nest" else self.hospitals[start_location]
-        end = Hospital("Nest", 0, 0) if end_location == "Nest" else self.hospitals[end_location]
-
-        distance = math.sqrt((end.north_m - start.north_m) ** 2 + (end.east_m - start.east_m) ** 2)
-        return int(distance / ZIP_SPEED_MPS)
+        return int(self._seg_time[self._location_ids[start_location], self._location_ids[end_location]])
 
 
     def calculate_route_times(self, route: List[str]) -> List[int]:
         """
         Calculate flight time for each segment of the route.
         """
-        return [self.calculate_segment_time(route[i], route[i + 1]) for i in range(len(route) - 1)]
+        route_ids = tuple(self._location_ids[name] for name in route)
+        route_times = self._route_times_cache.get(route_ids)
+        if route_times is None:
+            ids = np.array(route_ids, dtype=np.intp)
+            route_times = tuple(self._seg_time[ids[:-1], ids[1:]].tolist())
+            self._route_times_cache[route_ids] = route_times
+        return list(route_times)
 
 
     def get_available_zips(self, current_time: int) -> List[int]:
         """
-        Get a list of Zip IDs that are available.
+        Take the available Zips off the availability heap and return their IDs in Zip order.
+        Callers must push each Zip back with the time it becomes available again.
+        """
+        available_zips = []
+        while self._zip_heap and self._zip_heap[0][0] <= current_time:
+            available_zips.append(heapq.heappop(self._zip_heap)[1])
+        available_zips.sort()
+        return available_zips
+
+
+    def next_zip_available_time(self) -> int:
+        """
+        Get the earliest time at which a Zip is available.
         """
-        return [zip_id for zip_id, available_time in self.zip_availability.items() if current_time >= available_time]
+        return self._zip_heap[0][0]
+
+
+    def has_unfulfilled_orders(self) -> bool:
+        """
+        Check whether any queued order still waits for a flight.
+        """
+        return bool(self._unfulfilled_orders)
 
 
     def queue_order(self, order: Order) -> None:
         """
         Add a new order to the unfulfilled order queue.
         """
-        self._unfulfilled_orders.append(order)
+        heapq.heappush(self._unfulfilled_orders, (order.priority_rank, order.time, order.order_id, order))
 
 
     def launch_flights(self, current_time: int, flight_id_counter: int) -> Tuple[List[Flight], int]:
@@ -128,49 +256,48 @@ class ZipScheduler:
         if not self._unfulfilled_orders:
             return flights, flight_id_counter
 
+        # every Zip tries the head of the queue first: if it is out of range, no Zip can launch
+        head_location = self._location_ids[self._unfulfilled_orders[0][-1].hospital.name]
+        if self._leg_with_return[0, head_location] > ZIP_MAX_CUMULATIVE_RANGE_M:
+            return flights, flight_id_counter
+
         available_zips = self.get_available_zips(current_time)
         if not available_zips:
             return flights, flight_id_counter
 
-        # sort orders: Emergency orders first, then by earliest time
-        self._unfulfilled_orders.sort(key=lambda x: (x.priority != EMERGENCY, x.time))
-
+        # bind what the loop uses on every Zip to locals once
+        unfulfilled_orders = self._unfulfilled_orders
+        zip_heap = self._zip_heap
+        location_ids = self._location_ids
+        dist, leg_with_return = self._dist, self._leg_with_return
+        heappop, heappush = heapq.heappop, heapq.heappush
+        capacity, max_range = MAX_PACKAGES_PER_ZIP, ZIP_MAX_CUMULATIVE_RANGE_M
+        nest = NEST.name
+
+        # take the highest priority orders for all available Zips off the queue as candidates
+        candidates = [heappop(unfulfilled_orders)
+                      for _ in range(min(capacity * len(available_zips), len(unfulfilled_orders)))]
+        candidate_orders = [entry[-1] for entry in candidates]
+        hids = np.array([location_ids[order.hospital.name] for order in candidate_orders], dtype=np.intp)
+
+        # each Zip packs from where the previous one stopped; for long windows,
+        # pack from every start in parallel up front and only chain the counts
+        counts = None
+        if pick_orders_from_every_start is not None and len(hids) >= PARALLEL_PACKING_MIN_CANDIDATES:
+            counts = pick_orders_from_every_start(hids, dist, leg_with_return, capacity, max_range)
+
+        start = 0
         for zip_id in available_zips:
-            if not self._unfulfilled_orders:
-                break
-
-            flight_orders = []
-            route = ["Nest"]
-            total_distance = 0
-            last_location = (0, 0)  # start at Nest
-
-            for order in list(self._unfulfilled_orders):
-                if len(flight_orders) >= MAX_PACKAGES_PER_ZIP:
-                    break  # stop adding orders when max capacity is reached
-
-                hospital_location = (order.hospital.north_m, order.hospital.east_m)
-                distance_to_hospital = math.sqrt(
-                    (hospital_location[0] - last_location[0]) ** 2 +
-                    (hospital_location[1] - last_location[1]) ** 2
-                )
-                return_distance = math.sqrt(
-                    (hospital_location[0] - 0) ** 2 + (hospital_location[1] - 0) ** 2
-                )
-
-                if total_distance + distance_to_hospital + return_distance > ZIP_MAX_CUMULATIVE_RANGE_M:
-                    break  # ensure the Zip does not exceed max cumulative flight range
-
-                # add hospital to route
-                route.append(order.hospital.name)
-                flight_orders.append(order)
-                total_distance += distance_to_hospital
-                last_location = hospital_location
-
-                self._unfulfilled_orders.remove(order)
+            count = 0
+            if start < len(hids):
+                count = int(counts[start]) if counts is not None else pick_orders(hids[start:], dist, leg_with_return, capacity, max_range)
+            flight_orders = candidate_orders[start:start + count]
+            start += count
+            route = [nest] + [order.hospital.name for order in flight_orders]
 
             # return to Nest after last delivery
             if flight_orders:
-                route.append("Nest")
+                route.append(nest)
 
                 # calculate segment times
                 route_times = self.calculate_route_times(route)
@@ -178,7 +305,7 @@ class ZipScheduler:
                 completion_time = current_time + total_flight_time
 
                 # mark Zip as unavailable until completion
-                self.zip_availability[zip_id] = completion_time
+                heappush(zip_heap, (completion_time, zip_id))
 
                 # store flight details
                 flights.append(Flight(
@@ -191,41 +318,96 @@ class ZipScheduler:
                     route_times=route_times
                 ))
                 flight_id_counter += 1
+            else:
+                heappush(zip_heap, (current_time, zip_id))  # nothing to deliver, Zip stays available
+
+        # orders that did not fit go back to the queue
+        for entry in candidates[start:]:
+            heappush(unfulfilled_orders, entry)
 
         return flights, flight_id_counter
 
 
 class Runner:
-    def __init__(self, hospitals_path: str, orders_path: str):
+    def __init__(self, hospitals_path: str, orders_path: str, output_path: Optional[str] = None):
         with open(hospitals_path, "r") as f:
             self.hospitals = Hospital.load_from_csv(f)
         with open(orders_path, "r") as f:
-            self.orders = Order.load_from_csv(f, self.hospitals)
+            self.orders = deque(sorted(Order.load_from_csv(f, self.hospitals), key=lambda order: order.time))
         self.scheduler = ZipScheduler(hospitals=self.hospitals)
         self.flight_id_counter = 1
-        self.flight_data = []
+
+        # with an output path the schedule is streamed to CSV, otherwise it is kept for get_flight_dataframe
+        self.output_path = output_path
+        self._flight_ids: List[int] = []
+        self._zip_ids: List[int] = []
+        self._from: List[str] = []
+        self._to: List[str] = []
+        self._launch_times: List[int] = []
 
     def run(self) -> None:
+        if self.output_path is None:
+            for flight in self.__simulate():
+                num_segments = len(flight.route) - 1
+                self._flight_ids.extend([flight.flight_id] * num_segments)
+                self._zip_ids.extend([flight.zip_id] * num_segments)
+                self._from.extend(flight.route[:-1])
+                self._to.extend(flight.route[1:])
+                self._launch_times.extend([flight.launch_time] * num_segments)
+            return
+
+        with open(self.output_path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(FLIGHT_SCHEDULE_COLUMNS)
+            for flight in self.__simulate():
+                writer.writerows(zip(
+                    repeat(flight.flight_id),
+                    repeat(flight.zip_id),
+                    flight.route[:-1],
+                    flight.route[1:],
+                    repeat(flight.launch_time)
+                ))
+
+    def __simulate(self) -> Iterator[Flight]:
         sec_per_day = 24 * 60 * 60
-        for sec_since_midnight in range(self.orders[0].time, sec_per_day, 60):
+        first_tick = self.orders[0].time
+        sec_since_midnight = first_tick
+        while sec_since_midnight < sec_per_day:
             self.__queue_pending_orders(sec_since_midnight)
             flights, self.flight_id_counter = self.scheduler.launch_flights(sec_since_midnight, self.flight_id_counter)
-            for flight in flights:
-                for stop in range(len(flight.route) - 1):
-                    self.flight_data.append([
-                        flight.flight_id,
-                        flight.zip_id,
-                        flight.route[stop],
-                        flight.route[stop + 1],
-                        flight.launch_time
-                    ])
+            yield from flights
+
+            # skip ahead to the first scheduling tick (every 60 s) at or after the next event
+            next_event_time = self.__next_event_time(sec_since_midnight)
+            if next_event_time is None:
+                break
+            ticks = -(-(next_event_time - first_tick) // 60)
+            sec_since_midnight = max(sec_since_midnight + 60, first_tick + ticks * 60)
+
+    def __next_event_time(self, sec_since_midnight: int) -> Optional[int]:
+        """
+        Get the next time an order arrives or a Zip could pick up a waiting order.
+        Returns None when nothing is left to schedule.
+        """
+        event_times = []
+        if self.orders:
+            event_times.append(self.orders[0].time)
+        if self.scheduler.has_unfulfilled_orders():
+            # a Zip still idle now means no Zip can fly the head of the queue until a new order arrives
+            zip_available_time = self.scheduler.next_zip_available_time()
+            if zip_available_time > sec_since_midnight:
+                event_times.append(zip_available_time)
+        return min(event_times) if event_times else None
 
     def __queue_pending_orders(self, sec_since_midnight: int) -> None:
         while self.orders and self.orders[0].time <= sec_since_midnight:
-            self.scheduler.queue_order(self.orders.pop(0))
+            self.scheduler.queue_order(self.orders.popleft())
 
     def get_flight_dataframe(self) -> pd.DataFrame:
-        return pd.DataFrame(self.flight_data, columns=["Flight ID", "Zip ID", "From", "To", "Launch Time"])
+        if self.output_path is not None:
+            raise RuntimeError(f"flight schedule was streamed to {self.output_path} and is not kept in memory")
+        columns = [self._flight_ids, self._zip_ids, self._from, self._to, self._launch_times]
+        return pd.DataFrame(dict(zip(FLIGHT_SCHEDULE_COLUMNS, columns)))
 
 
 """
@@ -253,9 +435,9 @@ if __name__ == "__main__":
     runner = Runner(
         hospitals_path=hospitals_path,
         orders_path=orders_path,
+        output_path=output_path,
     )
-    runner.run()
 
-    # save results to CSV
-    runner.get_flight_dataframe().to_csv(output_path, index=False)
+    # write results to CSV as flights are scheduled
+    runner.run()
 